@@ -0,0 +1,227 @@
+import io
+import os
+import threading
+
+import streamlit as st
+import matplotlib.style as mplstyle
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+import matplotlib.image as mpimg
+import matplotlib.patheffects as mpe
+import numpy as np
+
+from storage import BASE_DIR, file_mtime
+
+# path.simplify / agg.path.chunksize をまとめて設定する軽量プリセット。
+# なお legend(loc='best') は総当たり探索で重いので、凡例を足すときも
+# 位置は明示すること
+mplstyle.use('fast')
+
+# ==========================================
+# ⚙️ 描画設定
+# ==========================================
+BG_IMAGE_FILE = "runway.png"
+BG_PATH = os.path.join(BASE_DIR, BG_IMAGE_FILE)
+
+PAD_X = 60
+PAD_Y = 80
+MAP_DPI = 72  # 配信先はスマホ画面。PNG のバイト数はピクセル数に比例する
+
+WIND_LEVELS = {
+    "無風": {"val": 0.0, "color": "gray",      "label": "CALM"},
+    "微風": {"val": 2.0, "color": "#00BCD4",   "label": "LIGHT"},
+    "弱風": {"val": 4.5, "color": "#2962FF",   "label": "WEAK"},
+    "中風": {"val": 7.0, "color": "#FFC107",   "label": "MID"},
+    "強風": {"val": 10.0, "color": "#FF5252",  "label": "HIGH"}
+}
+
+# 時計方向 (0〜11時) → 矢印の単位ベクトル。12通りしかないので起動時に
+# 計算しておき、描画ループでは三角関数を呼ばない
+_CLOCK_ANGLE_RAD = np.radians(90 - np.arange(12) * 30 + 180)
+_CLOCK_U = np.cos(_CLOCK_ANGLE_RAD)
+_CLOCK_V = np.sin(_CLOCK_ANGLE_RAD)
+
+# WIND_LEVELS を添字で引ける並列配列に展開しておく
+# (描画ループ内で文字列キーの dict 参照をしない)
+_LEVEL_IDX = {name: i for i, name in enumerate(WIND_LEVELS)}
+_LEVEL_VAL = [info["val"] for info in WIND_LEVELS.values()]
+_LEVEL_COLOR = [info["color"] for info in WIND_LEVELS.values()]
+_LEVEL_LABEL = [info["label"] for info in WIND_LEVELS.values()]
+
+# 風ラベルの吹き出し (bbox) は Text と FancyBboxPatch の2 Artist を作るので、
+# 白フチの縁取り1本で背景から浮かせる (Artist 数がラベルあたり半分になる)
+_LABEL_EFFECTS = [mpe.withStroke(linewidth=3, foreground='white')]
+_MARKER_BBOX = dict(facecolor='white', alpha=0.6, edgecolor='none', pad=1)
+
+# ==========================================
+# 🗺️ 描画関数群
+# ==========================================
+@st.cache_resource(show_spinner=False)
+def _bg_image(path, mtime):
+    # runway.png のデコード結果をプロセス内で使い回す
+    # (mtime は画像差し替え検知用のキャッシュキー)
+    return mpimg.imread(path)
+
+def _data_key(data):
+    # dict をキャッシュキーにできる tuple へ正規化
+    return tuple(sorted(
+        (k, v.get("clock"), v.get("level")) for k, v in data.items()
+        if isinstance(v, dict)
+    ))
+
+# 矢印がこの本数を超えたら LTTB で代表点に間引く (quiver コストの上限)
+_MAX_ARROWS = 40
+
+def _downsample_lttb(items, threshold):
+    # items: 距離昇順の (dist, clock, level) リスト。
+    # (距離, 風速) 系列への largest-triangle-three-buckets で、
+    # 風速変化の形を保ったまま threshold 点に落とす。
+    n = len(items)
+    if threshold >= n or threshold < 3:
+        return items
+    ys = [_LEVEL_VAL[_LEVEL_IDX.get(lvl, 0)] for _, _, lvl in items]
+    xs = [d for d, _, _ in items]
+    sampled = [items[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = max(1, avg_end - avg_start)
+        avg_x = sum(xs[avg_start:avg_end]) / span
+        avg_y = sum(ys[avg_start:avg_end]) / span
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        max_area = -1.0
+        next_a = range_start
+        for j in range(range_start, range_end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > max_area:
+                max_area = area
+                next_a = j
+        sampled.append(items[next_a])
+        a = next_a
+    sampled.append(items[-1])
+    return sampled
+
+def _fig_size(max_dist):
+    # モバイルで見やすい範囲に高さを抑える (背景と本図で共通)
+    fig_height = max(6, min(15, 10 * (max_dist / 600)))
+    return (4, min(8, fig_height))
+
+def render_map_png(data, max_dist):
+    return _render_map_cached(_data_key(data), max_dist)
+
+@st.cache_resource(show_spinner=False)
+def _render_background(max_dist, bg_mtime):
+    # 静的な背景 (滑走路・距離マーカー) は変わらないので一度だけ描いて画像化する
+    # (bg_mtime は runway.png 差し替え検知用のキャッシュキー)
+    fig = Figure(figsize=_fig_size(max_dist))
+    ax = fig.add_subplot()
+    ax.set_xlim(0 - PAD_X, 100 + PAD_X)
+    ax.set_ylim(0 - PAD_Y, max_dist + PAD_Y)
+
+    if bg_mtime:
+        ax.imshow(_bg_image(BG_PATH, bg_mtime), extent=[0, 100, 0, max_dist])
+    else:
+        ax.set_facecolor('#F0F5F0')
+        lawn = Rectangle((0, 0), 100, max_dist, color='#8BC34A', alpha=0.3)
+        ax.add_patch(lawn)
+        runway = Rectangle((30, 0), 40, max_dist, color='#555555', alpha=0.9)
+        ax.add_patch(runway)
+        ax.plot([50, 50], [0, max_dist], color='white', linestyle='--', linewidth=2)
+        step = 100 if max_dist > 300 else 50
+        for d in range(0, max_dist + 1, step):
+            ax.text(-25, d, f"{d}m", color='black', fontsize=10, ha='right', va='center',
+                    bbox=_MARKER_BBOX)
+    ax.axis('off')
+    fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=MAP_DPI)
+    buf.seek(0)
+    return mpimg.imread(buf)
+
+@st.cache_resource(show_spinner=False)
+def _get_base_fig(max_dist, bg_mtime):
+    # Figure/Axes の構築はアロケーションが大きいのでプロセスで1つを
+    # 使い回し、矢印などの動的 Artist だけを入れ替える
+    fig = Figure(figsize=_fig_size(max_dist))
+    ax = fig.add_subplot()
+    ax.set_xlim(0 - PAD_X, 100 + PAD_X)
+    ax.set_ylim(0 - PAD_Y, max_dist + PAD_Y)
+    ax.imshow(_render_background(max_dist, bg_mtime),
+              extent=[0 - PAD_X, 100 + PAD_X, 0 - PAD_Y, max_dist + PAD_Y],
+              aspect='auto', zorder=0)
+    ax.axis('off')
+    # 軸なし・範囲固定なので tight_layout のレイアウトソルバは不要
+    fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+    return fig, ax, []  # 3要素目は動的 Artist のハンドル置き場
+
+def _points_from_key(data_key, max_dist):
+    # data_key を描画用の配列群 (マーカー・矢印・ラベル) に展開する。
+    # 呼び出し元の _render_map_cached が同じキーでキャッシュ済みなので、
+    # ここをさらに cache_data で包む必要はない
+    base_scale = 20.0 if max_dist <= 600 else 30.0
+    xs, ys = [], []
+    qx, qy, qu, qv, q_colors = [], [], [], [], []
+    labels = []
+    # storage 側で型検証済みなので、ここでは try/except を張らない
+    items = sorted((int(k), clock, level) for k, clock, level in data_key)
+    if len(items) > _MAX_ARROWS:
+        items = _downsample_lttb(items, _MAX_ARROWS)
+    for dist_m, clock, level_name in items:
+        if dist_m < 0 or dist_m > max_dist: continue
+        lvl = _LEVEL_IDX.get(level_name, 0)
+        speed_val = _LEVEL_VAL[lvl]
+        x, y = 50, dist_m
+        xs.append(x)
+        ys.append(y)
+
+        if lvl > 0 and speed_val > 0:
+            idx = clock % 12
+            arrow_len = base_scale + (speed_val * 7.0)
+            qx.append(x)
+            qy.append(y)
+            qu.append(_CLOCK_U[idx] * arrow_len)
+            qv.append(_CLOCK_V[idx] * arrow_len)
+            q_colors.append(_LEVEL_COLOR[lvl])
+            labels.append((x + 20, y, _LEVEL_LABEL[lvl], 'black', 12))
+        else:
+            labels.append((x + 20, y, "CALM", 'gray', 11))
+    return xs, ys, (qx, qy, qu, qv, q_colors), labels
+
+# cache_resource の Figure は全セッション共有だが、cache_data が直列化
+# するのは同一キーの計算だけ。別キーを同時に描く2セッションが同じ Axes を
+# 触らないよう、Artist 差し替え〜savefig はロックで囲む
+_RENDER_LOCK = threading.Lock()
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _render_map_cached(data_key, max_dist):
+    # 1地点ずつ quiver/plot を呼ぶと Artist が点数分できるので、
+    # 配列に溜めて scatter 1回 + quiver 1回にまとめる
+    xs, ys, (qx, qy, qu, qv, q_colors), labels = _points_from_key(data_key, max_dist)
+
+    # stat はデータキーのキャッシュミス時にしか走らない。runway.png を
+    # 差し替えると mtime が変わり、背景・ベース図とも描き直される
+    bg_mtime = file_mtime(BG_PATH)
+
+    with _RENDER_LOCK:
+        fig, ax, dyn = _get_base_fig(max_dist, bg_mtime)
+        while dyn:
+            dyn.pop().remove()
+
+        if xs:
+            dyn.append(ax.scatter(xs, ys, c='black', s=64, zorder=3))
+        if qx:
+            dyn.append(ax.quiver(qx, qy, qu, qv, color=q_colors, angles='xy', scale_units='xy', scale=1,
+                                 width=0.025, headwidth=4, edgecolor='white', linewidth=1.5, zorder=4))
+        for lx, ly, label_text, label_color, label_size in labels:
+            dyn.append(ax.text(lx, ly, label_text, color=label_color, fontsize=label_size, fontweight='bold',
+                               path_effects=_LABEL_EFFECTS, zorder=5))
+
+        # Figure ごと Streamlit に渡すと毎回シリアライズされるので、
+        # PNG バイト列に落として返す
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=MAP_DPI)
+    return buf.getvalue()
@@ -0,0 +1,172 @@
+import json
+import mmap
+import os
+import time
+
+import streamlit as st
+
+try:
+    import orjson  # C拡張のJSONパーサ (無ければ標準ライブラリで動く)
+except ImportError:
+    orjson = None
+
+# ==========================================
+# 💾 データ永続化 (全モード共通の唯一の実装)
+# ==========================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(BASE_DIR, "wind_data.jsonl")
+LEGACY_DATA_FILE = os.path.join(BASE_DIR, "wind_data_v36.json")
+CONFIG_FILE = os.path.join(BASE_DIR, "wind_config.json")
+
+# 追記ログがこのサイズを超えたら最新状態に畳み込んで書き直す
+COMPACT_SIZE = 64 * 1024
+
+# 風の強さの正規順序。ディスク上は添字 (int) で持ち、文字列比較や
+# 日本語のエスケープをホットパスから外す
+LEVEL_NAMES = ["無風", "微風", "弱風", "中風", "強風"]
+
+def _level_code(level_name):
+    try: return LEVEL_NAMES.index(level_name)
+    except ValueError: return 0
+
+def file_mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+def _write_json_atomic(path, data):
+    # "w" で直接開くと truncate された瞬間を Monitor 側が読んでしまうので
+    # 一時ファイルに書いてから os.replace でアトミックに差し替える
+    tmp = path + ".tmp"
+    if orjson:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+@st.cache_data(show_spinner=False)
+def _load_json_cached(path, mtime):
+    # mtime はキャッシュキー専用 (ファイル更新時だけ再パースさせる)
+    # read() のコピーを挟まず、ページキャッシュを直接マップして読む
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空ファイルは mmap できない
+            return {}
+        try:
+            raw = mm[:]
+        finally:
+            mm.close()
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def load_config():
+    default_conf = {"max_distance": 600}
+    if not os.path.exists(CONFIG_FILE): return default_conf
+    try:
+        return _load_json_cached(CONFIG_FILE, file_mtime(CONFIG_FILE))
+    except: return default_conf
+
+def save_config(max_distance):
+    config = {"max_distance": max_distance}
+    try:
+        _write_json_atomic(CONFIG_FILE, config)
+        _load_json_cached.clear()
+    except Exception as e: st.error(str(e))
+
+# ------------------------------------------
+# 風データは追記専用の JSONL ログで持つ。
+# 1クリック = 1行の append (O(1)) で、読み側は last-write-wins で
+# dict に畳み込む。削除は {"del": true} の墓標レコード。
+# ------------------------------------------
+def _dumps_record(rec):
+    if orjson:
+        return orjson.dumps(rec) + b"\n"
+    return (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _fold_log(raw):
+    data = {}
+    for line in raw.splitlines():
+        line = line.strip()
+        if not line: continue
+        try:
+            rec = orjson.loads(line) if orjson else json.loads(line)
+            # ここで型を正規化しておく (壊れた行は捨てる)。描画側は
+            # 検証済みデータだけを受け取る前提で動く
+            dist_key = str(int(rec["d"]))
+            if rec.get("del"):
+                data.pop(dist_key, None)
+            else:
+                # 新形式は "lvl" (int コード)、旧形式は "l" (名前) を受ける
+                lvl = int(rec["lvl"]) if "lvl" in rec else _level_code(rec.get("l"))
+                if not 0 <= lvl < len(LEVEL_NAMES): lvl = 0
+                data[dist_key] = {"clock": int(rec["c"]), "level": LEVEL_NAMES[lvl],
+                                  "updated": float(rec.get("t", 0.0))}
+        except: continue
+    return data
+
+@st.cache_data(show_spinner=False)
+def _load_log_cached(path, mtime):
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空ファイルは mmap できない
+            return {}
+        try:
+            raw = mm[:]
+        finally:
+            mm.close()
+    return _fold_log(raw)
+
+def _rewrite_log(data):
+    # 畳み込んだ状態をアトミックに書き直す (compaction / 全削除 / 移行用)
+    tmp = DATA_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        for dist_key, item in data.items():
+            f.write(_dumps_record({"d": dist_key, "c": item.get("clock", 12),
+                                   "lvl": _level_code(item.get("level")),
+                                   "t": item.get("updated", 0.0)}))
+    os.replace(tmp, DATA_FILE)
+    _load_log_cached.clear()
+
+def _append_record(rec):
+    with open(DATA_FILE, "ab") as f:
+        f.write(_dumps_record(rec))
+    _load_log_cached.clear()
+
+def _compact_if_needed():
+    try:
+        if os.path.getsize(DATA_FILE) < COMPACT_SIZE: return
+        _rewrite_log(load_all_data())
+    except: pass
+
+def _migrate_legacy_json():
+    # 旧形式 (dict 全体を1つの JSON で保持) からの一回限りの移行
+    if os.path.exists(DATA_FILE) or not os.path.exists(LEGACY_DATA_FILE): return
+    try:
+        old = _load_json_cached(LEGACY_DATA_FILE, file_mtime(LEGACY_DATA_FILE))
+        _rewrite_log(old if isinstance(old, dict) else {})
+        os.replace(LEGACY_DATA_FILE, LEGACY_DATA_FILE + ".bak")
+    except: pass
+
+def load_all_data():
+    _migrate_legacy_json()
+    if not os.path.exists(DATA_FILE): return {}
+    try:
+        return _load_log_cached(DATA_FILE, file_mtime(DATA_FILE))
+    except: return {}
+
+def save_point_data(distance_m, clock_dir, level_name):
+    try:
+        _append_record({"d": distance_m, "c": clock_dir, "lvl": _level_code(level_name), "t": time.time()})
+        _compact_if_needed()
+    except: pass
+
+def delete_point_data(distance_m):
+    if str(distance_m) in load_all_data():
+        _append_record({"d": distance_m, "del": True, "t": time.time()})
+        _compact_if_needed()
+
+def clear_all_data():
+    try:
+        _rewrite_log({})
+    except Exception as e: st.error(str(e))